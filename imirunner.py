@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import os
+import re
 import sys
 import json
 import time
@@ -10,7 +11,25 @@ import logging
 import boto3
 import yaml
 import subprocess
+import tempfile
+import asyncio
 from datetime import datetime
+from types import SimpleNamespace
+from functools import lru_cache
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED
+
+# Prefer the libyaml C loader when available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# asyncssh is optional; without it transfers fall back to scp subprocesses
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,9 +38,23 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 INSTANCE_ID_VAR = "AWS_INSTANCE_ID"
 PUBLIC_URL_VAR = "AWS_PUBLIC_URL"
 
+# Set to 1 to replace AWS calls with canned responses
+DRY_RUN_VAR = "IMIRUNNER_DRY_RUN"
+
+# Log lines that mark the end of an IMI run
+RUN_COMPLETE_PATTERN = re.compile(r'Posterior|IMI ended')
+
+@lru_cache(maxsize=8)
+def _load_yaml(path, mtime):
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=SafeLoader) or {}
+
+def load_yaml(path):
+    """Parse a YAML file, reusing the previous result while its mtime is unchanged"""
+    return _load_yaml(os.path.abspath(path), os.stat(path).st_mtime_ns)
+
 # Load configuration
-with open('settings.yml', 'r') as f:
-    config = yaml.safe_load(f)
+config = load_yaml('settings.yml')
 
 AWS_REGION = config['aws']['region']
 AMI_ID = config['aws']['ami_id']
@@ -36,9 +69,206 @@ SHAPEFILE = config['region']['shapefile']
 STATE_VECTOR = config['region']['state_vector']
 ALT_STATE_VECTOR = config['region']['alt_state_vector']
 
-# Initialize boto3 client
-ec2 = boto3.client('ec2', region_name=AWS_REGION)
+# Initialize boto3 client with a shared session, pooled connections and adaptive retries
+boto_config = Config(
+    region_name=AWS_REGION,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    max_pool_connections=32,
+    connect_timeout=5,
+    read_timeout=30
+)
+session = boto3.Session()
+
+
+class DryRunClient:
+    """Stand-in for the EC2 client that logs each call and returns canned responses"""
+
+    def __init__(self):
+        launch_time = datetime(2024, 1, 1, 12, 0, 0)
+        self.instances = [
+            {'InstanceId': 'i-0dryrun000000001', 'State': {'Name': 'running'},
+             'PublicDnsName': 'ec2-dry-run-1.invalid', 'InstanceType': INSTANCE_TYPE,
+             'LaunchTime': launch_time},
+            {'InstanceId': 'i-0dryrun000000002', 'State': {'Name': 'stopped'},
+             'PublicDnsName': 'ec2-dry-run-2.invalid', 'InstanceType': INSTANCE_TYPE,
+             'LaunchTime': launch_time},
+        ]
+
+    def _log(self, operation, kwargs):
+        logging.info(f"[dry-run] ec2.{operation}({kwargs})")
+
+    def describe_instances(self, **kwargs):
+        self._log('describe_instances', kwargs)
+        ids = kwargs.get('InstanceIds')
+        instances = [inst for inst in self.instances if not ids or inst['InstanceId'] in ids]
+        return {'Reservations': [{'Instances': instances}]}
+
+    def run_instances(self, **kwargs):
+        self._log('run_instances', kwargs)
+        return {'Instances': [self.instances[0]]}
+
+    def describe_spot_instance_requests(self, **kwargs):
+        self._log('describe_spot_instance_requests', kwargs)
+        return {'SpotInstanceRequests': [
+            {'SpotInstanceRequestId': 'sir-dryrun01', 'InstanceId': self.instances[0]['InstanceId']}
+        ]}
+
+    def get_paginator(self, operation):
+        call = getattr(self, operation)
+        return SimpleNamespace(paginate=lambda **kwargs: SimpleNamespace(
+            build_full_result=lambda: call(**kwargs)))
+
+    def get_waiter(self, name):
+        return SimpleNamespace(wait=lambda **kwargs: self._log(f"get_waiter('{name}').wait", kwargs))
+
+    def __getattr__(self, operation):
+        # terminate_instances, stop_instances, start_instances, cancel_spot_instance_requests, ...
+        def call(**kwargs):
+            self._log(operation, kwargs)
+            return {}
+        return call
+
+
+# Decided at import (env var or --dry-run flag) so no real client is built in dry-run mode
+DRY_RUN = os.getenv(DRY_RUN_VAR) == "1" or "--dry-run" in sys.argv[1:]
+if DRY_RUN:
+    ec2 = DryRunClient()
+else:
+    ec2 = session.client('ec2', config=boto_config)
+
+# Short-lived cache of describe_instances results (ttl in seconds)
+_describe_cache = {"ts": 0.0, "data": None, "ttl": 30}
+
+def _cached_describe_instances(ttl=None):
+    """Return the Reservations list, reusing a recent describe_instances response"""
+    ttl = _describe_cache["ttl"] if ttl is None else ttl
+    if _describe_cache["data"] is None or time.time() - _describe_cache["ts"] >= ttl:
+        paginator = ec2.get_paginator('describe_instances')
+        _describe_cache["data"] = paginator.paginate(
+            Filters=[{'Name': 'instance-state-name',
+                      'Values': ['pending', 'running', 'stopping', 'stopped']}]
+        ).build_full_result()['Reservations']
+        _describe_cache["ts"] = time.time()
+    return _describe_cache["data"]
+
+def _invalidate_describe_cache():
+    _describe_cache["data"] = None
+    _describe_cache["ts"] = 0.0
+
+# Listing index 0, remembered across invocations so default (-i 0) commands can skip
+# describe_instances. Only get_instance(0) writes it, so it always means "index 0".
+STATE_FILE = os.path.expanduser("~/.cache/imirunner/state.json")
+STATE_MAX_AGE = 600  # seconds
+
+def _load_state():
+    """Return the saved instance state if it is recent enough, otherwise None"""
+    if isinstance(ec2, DryRunClient) or _describe_cache["ttl"] == 0:
+        return None
+    try:
+        with open(STATE_FILE, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - state.get('ts', 0) > STATE_MAX_AGE:
+        return None
+    return state
+
+def _save_state(instance_id, public_dns, state):
+    if isinstance(ec2, DryRunClient):
+        return
+    try:
+        os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+        with open(STATE_FILE, 'w') as f:
+            json.dump({'instance_id': instance_id, 'public_dns': public_dns,
+                       'state': state, 'ts': time.time()}, f)
+    except OSError as e:
+        logging.warning(f"Could not save instance state: {e}")
+
+def _clear_state():
+    try:
+        os.remove(STATE_FILE)
+    except OSError:
+        pass
+
+# Instance resolved for -i 0 in this process, so later lookups in the same command agree
+_current_instance = {}
+
+def _use_instance(instance_id, public_dns, state):
+    os.environ[INSTANCE_ID_VAR] = instance_id
+    os.environ[PUBLIC_URL_VAR] = public_dns
+    _current_instance.update(instance_id=instance_id, public_dns=public_dns, state=state)
+
+def _describe_instance(instance_id):
+    """Fresh {instance_id, public_dns, state} for one instance, or None if it is gone"""
+    try:
+        reservations = ec2.describe_instances(InstanceIds=[instance_id])['Reservations']
+    except Exception:
+        return None
+    for res in reservations:
+        for inst in res['Instances']:
+            if inst['State']['Name'] in ('shutting-down', 'terminated'):
+                return None
+            return {'instance_id': inst['InstanceId'],
+                    'public_dns': inst.get('PublicDnsName', 'N/A'),
+                    'state': inst['State']['Name']}
+    return None
+
+# Multiplex ssh/scp/rsync sessions over one persistent connection per host
+SSH_OPTS = [
+    "-o", "ControlMaster=auto",
+    "-o", "ControlPath=/tmp/imirunner-%r@%h:%p",
+    "-o", "ControlPersist=600"
+]
+
+# Prebuilt argv prefixes and the ssh command line for rsync -e
+_SSH_PREFIX = ("ssh", "-i", SSH_KEY_PATH, *SSH_OPTS)
+_SCP_PREFIX = ("scp", "-i", SSH_KEY_PATH, *SSH_OPTS)
+SSH_COMMAND = " ".join(_SSH_PREFIX)
+
+def _ssh(host, *command, opts=()):
+    """argv for running command (or an interactive shell) on ubuntu@host"""
+    return (*_SSH_PREFIX, *opts, f"ubuntu@{host}", *command)
+
+def _scp(*paths):
+    """argv for copying paths[:-1] to paths[-1]; remote paths use ubuntu@host:path"""
+    return (*_SCP_PREFIX, *paths)
+
+def open_ssh_master(public_url):
+    """Open a background master connection for later ssh/scp calls to reuse"""
+    result = subprocess.run(
+        _ssh(public_url, opts=("-o", "BatchMode=yes", "-MNf")),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        logging.warning(f"Could not open shared SSH connection, falling back to per-call sessions: "
+                        f"{result.stderr.strip()}")
+
+def close_ssh_master(public_url):
+    """Shut down the master connection for a host that is going away"""
+    if not public_url or public_url == 'N/A':
+        return
+    subprocess.run(
+        _ssh(public_url, opts=("-O", "exit")),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
 
+def _saved_instance_reachable(saved):
+    """ssh into a saved instance; on failure re-check it with describe and drop the record"""
+    result = subprocess.run(
+        _ssh(saved['public_dns'], "true", opts=("-o", "BatchMode=yes", "-o", "ConnectTimeout=10")),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    if result.returncode == 0:
+        return True
+    fresh = _describe_instance(saved['instance_id'])
+    logging.warning(f"Saved instance {saved['instance_id']} is not reachable "
+                    f"({fresh['state'] if fresh else 'no longer exists'}), re-listing")
+    _clear_state()
+    return False
 
 
 def create_instance(options=None):
@@ -79,6 +309,7 @@ def create_instance(options=None):
             
         # Start instance
         response = ec2.run_instances(**run_args)
+        _invalidate_describe_cache()
         instance_id = response['Instances'][0]['InstanceId']
         logging.info(f"🆔 Instance ID: {instance_id}")
 
@@ -88,33 +319,46 @@ def create_instance(options=None):
         waiter.wait(
             InstanceIds=[instance_id],
             Filters=[{'Name': 'instance-state-name', 'Values': ['running']}],
-            WaiterConfig={'Delay': 30, 'MaxAttempts': 30}  # 15 minute timeout
+            WaiterConfig={'Delay': 10, 'MaxAttempts': 90}  # 15 minute timeout
         )
 
-        # Get connection details
-        instance = ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
-        public_dns = instance['PublicDnsName']
+        # Get connection details, only describing the instance if launch didn't report them
+        public_dns = response['Instances'][0].get('PublicDnsName')
+        if not public_dns:
+            instance = ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
+            public_dns = instance['PublicDnsName']
         logging.info(f"🌐 Public DNS: {public_dns}")
 
-        # Verify SSH accessibility
+        if DRY_RUN:
+            logging.info("[dry-run] Skipping SSH checks and instance setup")
+            os.environ[INSTANCE_ID_VAR] = instance_id
+            os.environ[PUBLIC_URL_VAR] = public_dns
+            return True
+
+        # Verify SSH accessibility. OpenSSH retries the TCP connect itself; the outer
+        # loop backs off and retries handshake/auth failures (sshd or cloud-init still starting).
+        # The probe also records the host key so later multiplexed connections don't prompt.
         logging.info("🔒 Testing SSH connectivity...")
-        ssh_ready = False
-        for _ in range(10):  # Additional 5 minute timeout
+        delay, deadline = 5, time.time() + 300  # Additional 5 minute timeout
+        while True:
             try:
                 subprocess.run(
-                    ["ssh", "-i", SSH_KEY_PATH, "-o", "ConnectTimeout=10", "-o", "StrictHostKeyChecking=no",
+                    ["ssh", "-i", SSH_KEY_PATH, "-o", "ConnectionAttempts=10", "-o", "ConnectTimeout=10",
+                     "-o", "StrictHostKeyChecking=no", "-o", "BatchMode=yes",
                      f"ubuntu@{public_dns}", "true"],
                     check=True,
                     stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
+                    stderr=subprocess.DEVNULL,
+                    timeout=180
                 )
-                ssh_ready = True
                 break
-            except subprocess.CalledProcessError:
-                time.sleep(30)
-        
-        if not ssh_ready:
-            raise Exception("SSH connection failed after 15 minutes")
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+                if time.time() + delay >= deadline:
+                    raise Exception("SSH connection failed after 5 minutes")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+        open_ssh_master(public_dns)
 
         # Run instance setup
         logging.info("🛠️ Starting instance setup...")
@@ -130,6 +374,35 @@ def create_instance(options=None):
         logging.error(f"❌ Instance creation failed: {e}")
         return False
 
+def _upload_files_scp(public_url, grouped):
+    """Copy each {remote_dir: [local_files]} group with its own scp, in parallel"""
+    def copy_group(remote_path, local_files):
+        subprocess.run(_scp(*local_files, f"ubuntu@{public_url}:{remote_path}"), check=True)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = {
+            pool.submit(copy_group, remote_path, local_files): tuple(local_files)
+            for remote_path, local_files in grouped.items()
+        }
+        wait(futures, return_when=ALL_COMPLETED)
+
+    return {local_files: future.exception()
+            for future, local_files in futures.items() if future.exception()}
+
+async def _upload_files_asyncssh(public_url, grouped):
+    """Copy each {remote_dir: [local_files]} group as concurrent channels on one connection"""
+    async with asyncssh.connect(public_url, username='ubuntu',
+                                client_keys=[SSH_KEY_PATH], connect_timeout=30) as conn:
+        results = await asyncio.gather(
+            *[asyncssh.scp(local_files, (conn, remote_path))
+              for remote_path, local_files in grouped.items()],
+            return_exceptions=True
+        )
+
+    return {tuple(local_files): result
+            for local_files, result in zip(grouped.values(), results)
+            if isinstance(result, Exception)}
+
 def instance_setup(public_url):
     try:
         # Copy required files
@@ -143,15 +416,27 @@ def instance_setup(public_url):
             (ALT_STATE_VECTOR, "/home/ubuntu/integrated_methane_inversion")
         ]
         
+        # Group files by destination so each directory costs one scp session
+        grouped = {}
         for local_file, remote_path in files_to_copy:
             if os.path.exists(local_file):
-                subprocess.run([
-                    "scp", "-i", SSH_KEY_PATH, 
-                    local_file, f"ubuntu@{public_url}:{remote_path}"
-                ])
+                grouped.setdefault(remote_path.rstrip('/') + '/', []).append(local_file)
             else:
                 logging.warning(f"Missing file: {local_file}")
 
+        # Upload over one asyncssh connection when available, otherwise parallel scp
+        failures = None
+        if asyncssh:
+            try:
+                failures = asyncio.run(_upload_files_asyncssh(public_url, grouped))
+            except Exception as e:
+                logging.warning(f"asyncssh upload failed ({e}), falling back to scp")
+        if failures is None:
+            failures = _upload_files_scp(public_url, grouped)
+
+        for local_files, error in failures.items():
+            logging.warning(f"Failed to copy {', '.join(local_files)}: {error}")
+
         # Execute setup commands
         commands = [
             "sudo apt remove -y tmux",
@@ -178,10 +463,16 @@ def instance_setup(public_url):
             "open(p,'w').write(t)\"",
         ]
         
-        subprocess.run([
-            "ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}",
-            " && ".join(commands)
-        ])
+        # Optional tuning, run after (and independently of) the required steps:
+        # use the CRT transfer client for parallel multipart aws s3 cp
+        optional_commands = [
+            "aws configure set default.s3.preferred_transfer_client crt",
+        ]
+        
+        subprocess.run(_ssh(
+            public_url,
+            " && ".join(commands) + "; " + "; ".join(f"{{ {cmd} || true; }}" for cmd in optional_commands)
+        ))
         
         return True
         
@@ -192,13 +483,16 @@ def instance_setup(public_url):
 def terminate_instance(instance_no=0):
     instance_id = os.getenv(INSTANCE_ID_VAR)
     if instance_no or not instance_id:
-        if not get_instance(instance_no):
+        if not get_instance(instance_no, use_saved=False):
             logging.error("No instance found")
             return
         instance_id = os.getenv(INSTANCE_ID_VAR)
     
     try:
         ec2.terminate_instances(InstanceIds=[instance_id])
+        _invalidate_describe_cache()
+        _clear_state()
+        close_ssh_master(os.getenv(PUBLIC_URL_VAR))
         logging.info(f"Terminated instance: {instance_id}")
         os.environ[INSTANCE_ID_VAR] = ""
         os.environ[PUBLIC_URL_VAR] = ""
@@ -208,7 +502,7 @@ def terminate_instance(instance_no=0):
 def stop_instance(instance_no=0):
     instance_id = os.getenv(INSTANCE_ID_VAR)
     if instance_no or not instance_id:
-        state = get_instance(instance_no)
+        state = get_instance(instance_no, use_saved=False)
         if state != 'running':
             logging.error("Instance not running")
             return
@@ -216,6 +510,9 @@ def stop_instance(instance_no=0):
     
     try:
         ec2.stop_instances(InstanceIds=[instance_id])
+        _invalidate_describe_cache()
+        _clear_state()
+        close_ssh_master(os.getenv(PUBLIC_URL_VAR))
         logging.info(f"Stopped instance: {instance_id}")
         os.environ[INSTANCE_ID_VAR] = ""
         os.environ[PUBLIC_URL_VAR] = ""
@@ -225,7 +522,7 @@ def stop_instance(instance_no=0):
 def restart_instance(instance_no=0):
     instance_id = os.getenv(INSTANCE_ID_VAR)
     if instance_no or not instance_id:
-        state = get_instance(instance_no)
+        state = get_instance(instance_no, use_saved=False)
         if state != 'stopped':
             logging.error("Instance not stopped")
             return
@@ -233,6 +530,8 @@ def restart_instance(instance_no=0):
     
     try:
         ec2.start_instances(InstanceIds=[instance_id])
+        _invalidate_describe_cache()
+        _clear_state()
         logging.info(f"Started instance: {instance_id}")
         os.environ[INSTANCE_ID_VAR] = ""
         os.environ[PUBLIC_URL_VAR] = ""
@@ -242,7 +541,7 @@ def restart_instance(instance_no=0):
 def cancel_spot(instance_no=0):
     try:
         # Resolve the instance ID for the given instance_no
-        if not get_instance(instance_no):
+        if not get_instance(instance_no, use_saved=False):
             logging.error("No instance found")
             return
         instance_id = os.getenv(INSTANCE_ID_VAR)
@@ -282,8 +581,7 @@ def run_preview_nc(configfile, instance_no=0, conda_env=None):
     # Read CondaEnv from config if not provided
     if not conda_env:
         try:
-            with open(configfile, 'r') as f:
-                run_config = yaml.safe_load(f)
+            run_config = load_yaml(configfile)
             conda_env = run_config.get("CondaEnv", "imi_env")
         except Exception:
             conda_env = "imi_env"
@@ -303,8 +601,7 @@ def run_preview_nc(configfile, instance_no=0, conda_env=None):
 
     logging.info(f"Running preview_to_netcdf.py on remote instance (conda env: {conda_env})...")
     result = subprocess.run(
-        ["ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}",
-         f"bash -lc '{inner_cmd}'"],
+        _ssh(public_url, f"bash -lc '{inner_cmd}'"),
         capture_output=False
     )
 
@@ -329,30 +626,20 @@ def run_command(configfile="config.yml", instance_no=0, options=None, tmux=False
 
         # Validate config file contents
         config_stem = os.path.splitext(os.path.basename(configfile))[0]
-        run_name = None
-        use_slurm = None
-
-        with open(configfile, 'r') as f:
-            for line in f:
-                # Process RunName line
-                if line.startswith('RunName:'):
-                    run_name_value = line.split(':', 1)[1].strip().strip('\"\'')
-                    if run_name_value != config_stem:
-                        logging.error(f"Config filename '{config_stem}' does not match RunName '{run_name_value}'")
-                        logging.error("Please ensure the config filename matches the RunName value")
-                        sys.exit(1)
-                    run_name = run_name_value
-                
-                # Process UseSlurm line
-                elif line.startswith('UseSlurm:'):
-                    slurm_value = line.split(':', 1)[1].strip().lower()
-                    if slurm_value == 'true':
-                        use_slurm = True
-                    elif slurm_value == 'false':
-                        use_slurm = False
-                    else:
-                        logging.error(f"Invalid UseSlurm value: {slurm_value}. Must be 'true' or 'false'")
-                        sys.exit(1)
+        run_config = load_yaml(configfile)
+
+        run_name = run_config.get('RunName')
+        if run_name is not None:
+            run_name = str(run_name)
+            if run_name != config_stem:
+                logging.error(f"Config filename '{config_stem}' does not match RunName '{run_name}'")
+                logging.error("Please ensure the config filename matches the RunName value")
+                sys.exit(1)
+
+        use_slurm = run_config.get('UseSlurm')
+        if use_slurm is not None and not isinstance(use_slurm, bool):
+            logging.error(f"Invalid UseSlurm value: {use_slurm}. Must be 'true' or 'false'")
+            sys.exit(1)
 
         # Validate UseSlurm vs tmux option
         if use_slurm is not None:
@@ -365,34 +652,26 @@ def run_command(configfile="config.yml", instance_no=0, options=None, tmux=False
                 logging.error("When not using Slurm (UseSlurm=false), you must specify --tmux")
                 sys.exit(1)
 
-        # File transfer and command execution
+        # File transfer and command execution (single scp session)
+        sources = [configfile]
         kalman_file = "KalmanPeriods.csv"
         if os.path.exists(kalman_file):
-            subprocess.run([
-                "scp", "-i", SSH_KEY_PATH,
-                kalman_file,
-                f"ubuntu@{public_url}:/home/ubuntu/integrated_methane_inversion/periods.csv"
-            ])
+            sources.append(kalman_file)
         else:
             logging.warning(f"{kalman_file} not found, skipping transfer")
 
-        subprocess.run([
-            "scp", "-i", SSH_KEY_PATH,
-            configfile,
-            f"ubuntu@{public_url}:/home/ubuntu/integrated_methane_inversion"
-        ])
+        subprocess.run(_scp(*sources, f"ubuntu@{public_url}:/home/ubuntu/integrated_methane_inversion/"))
 
         # Build execution command
         base_cmd = "cd /home/ubuntu/integrated_methane_inversion && "
+        if kalman_file in sources:
+            base_cmd += f"mv {kalman_file} periods.csv && "
         if tmux:
             execution_cmd = f"tmux new-session -d -s imi './run_imi.sh {configfile} {options or ''} > imi_output.log'"
         else:
             execution_cmd = f"sbatch run_imi.sh {configfile} {options or ''}"
 
-        subprocess.run([
-            "ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}",
-            base_cmd + execution_cmd
-        ])
+        subprocess.run(_ssh(public_url, base_cmd + execution_cmd))
 
         logging.info(f"Inversion started successfully for config: {configfile}")
         tail_logfile(logfile="imi_output.log", instance_no=instance_no,
@@ -411,16 +690,15 @@ def tail_logfile(logfile="imi_output.log", instance_no=0, run_name=None,
     public_url = os.getenv(PUBLIC_URL_VAR)
     
     try:
-        cmd = [
-            "ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}",
-            f"tail -n 1000 -f integrated_methane_inversion/{logfile}"
-        ]
+        cmd = _ssh(public_url, f"tail -n 1000 -f integrated_methane_inversion/{logfile}", opts=("-q",))
         
         if run_name:
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-            for line in iter(process.stdout.readline, b''):
-                print(line.decode().strip())
-                if "Posterior" in line.decode() or "IMI ended" in line.decode():
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1,
+                                       text=True, errors='replace')
+            for line in iter(process.stdout.readline, ''):
+                line = line.rstrip()
+                print(line)
+                if RUN_COMPLETE_PATTERN.search(line):
                     logging.info("Run completed")
                     if preview_nc and configfile:
                         logging.info("Generating preview NetCDF files...")
@@ -441,10 +719,7 @@ def open_shell(instance_no=0, args=None):
     
     public_url = os.getenv(PUBLIC_URL_VAR)
 
-    cmd = ["ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}"]
-    
-    if args:
-        cmd.extend(args)
+    cmd = _ssh(public_url, *(args or []))
         
     try:
         subprocess.run(cmd)
@@ -453,25 +728,33 @@ def open_shell(instance_no=0, args=None):
 
 
 
-def copy_from_s3(run_name, instance_no=0):
+def copy_from_s3(run_names, instance_no=0):
+    runs = [run.strip() for run in run_names.split(',') if run.strip()]
+    if not runs:
+        logging.error("No run names given")
+        return
+
     if not get_instance(instance_no):
         return
         
     public_url = os.getenv(PUBLIC_URL_VAR)
     
     try:
-        subprocess.run([
-            "ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}",
-            f"mkdir -p /home/ubuntu/imi_output_dir/{run_name}"
-        ])
-        
-        subprocess.run([
-            "ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}",
-            f"cd /home/ubuntu/imi_output_dir/{run_name} && "
-            f"tmux new-session -d -s s3sync 'aws s3 cp s3://imidata/{run_name}/{run_name}.tar.gz - | tar -xz'"
-        ])
+        # Download each archive to disk (parallel multipart) and unpack it,
+        # up to 4 runs at a time, in a single detached tmux session
+        fetch_cmd = (
+            "mkdir -p RUN && cd RUN && "
+            "aws s3 cp --cli-read-timeout 0 s3://imidata/RUN/RUN.tar.gz RUN.tar.gz && "
+            "tar -xzf RUN.tar.gz && rm RUN.tar.gz"
+        )
+        subprocess.run(_ssh(
+            public_url,
+            f"mkdir -p /home/ubuntu/imi_output_dir && cd /home/ubuntu/imi_output_dir && "
+            f"tmux new-session -d -s s3sync '"
+            f"printf \"%s\\n\" {' '.join(runs)} | xargs -P 4 -I RUN sh -c \"{fetch_cmd}\"'"
+        ))
         
-        logging.info(f"Started S3 download for {run_name} in tmux session")
+        logging.info(f"Started S3 download for {', '.join(runs)} in tmux session")
         
     except Exception as e:
         logging.error(f"S3 copy failed: {e}")
@@ -491,6 +774,19 @@ def copy_to_local(run_name, instance_no=0, overwrite=False):
         # Define paths
         local_dir_base = os.path.join(LOCAL_DATA_PATH, run_name)
         remote_base = f"/home/ubuntu/imi_output_dir/{run_name}"
+
+        # Define all remote directories and files to copy (relative to remote_base)
+        transfer_dirs = ["preview", "inversion", "hemco_prior_emis", "archive_sf"]
+        transfer_files = ["imi_output.log", "StateVector.nc"]
+
+        # List the run directory once so *.yml can be matched locally
+        try:
+            listing = subprocess.check_output(_ssh(
+                public_url, f"find {remote_base} -mindepth 1 -maxdepth 1 -printf '%P\\n'"
+            )).decode().splitlines()
+        except subprocess.CalledProcessError:
+            logging.error(f"Could not list remote run directory: {remote_base}")
+            return None
         
         # Handle existing directories
         local_dir = local_dir_base
@@ -503,75 +799,29 @@ def copy_to_local(run_name, instance_no=0, overwrite=False):
 
         os.makedirs(local_dir, exist_ok=True)
 
-        # Define all remote directories and files to copy
-        transfer_dirs = [
-            # Directories (rsync)
-            (f"{remote_base}/preview", "preview"),
-            (f"{remote_base}/inversion", "inversion"),
-            (f"{remote_base}/hemco_prior_emis", "hemco_prior_emis"),
-            (f"{remote_base}/archive_sf", "archive_sf"),
-        ]
-        transfer_files = [
-            # Individual files (scp)
-            (f"{remote_base}/imi_output.log", ""),
-            (f"{remote_base}/StateVector.nc", ""),
-            (f"{remote_base}/*.yml", ""),
-            (f"{remote_base}/config_{run_name}.yml", "config.yml")
-        ]
-
-        # Copy each dir
-        for remote_path, local_subdir in transfer_dirs:
-            try:
-                local_target = os.path.join(local_dir, local_subdir) if local_subdir else local_dir
-            
-                subprocess.run([
-                    "rsync", "-azP",
-                    "-e", f"ssh -i {SSH_KEY_PATH}",
-                    f"ubuntu@{public_url}:{remote_path}/",
-                    f"{local_target}/"
-                ])
-   
-            except Exception as e:
-                logging.warning(f"Failed to copy {remote_path}: {str(e)}")
-                continue
-                
-        # Copy each file
-        for remote_path, local_subdir in transfer_files:
-            try:
-                local_target = os.path.join(local_dir, local_subdir) if local_subdir else local_dir
-                
-                if '*' in remote_path:  # Handle wildcard files
-                    files = subprocess.check_output([
-                        "ssh", "-i", SSH_KEY_PATH, f"ubuntu@{public_url}",
-                        f"ls {remote_path}"
-                    ]).decode().split()
-                    
-                    for f in files:
-                        subprocess.run([
-                            "scp", "-i", SSH_KEY_PATH,
-                            f"ubuntu@{public_url}:{f}",
-                            local_target
-                        ])
-                        
-                elif os.path.basename(remote_path).endswith('.yml'):  # Config file rename
-                    subprocess.run([
-                        "scp", "-i", SSH_KEY_PATH,
-                        f"ubuntu@{public_url}:{remote_path}",
-                        os.path.join(local_dir, "config.yml")
-                    ])
-                    
-                else:  
-                    # Single file
-                    subprocess.run([
-                        "scp", "-i", SSH_KEY_PATH,
-                        f"ubuntu@{public_url}:{remote_path}",
-                        local_target
-                    ])
-                        
-            except Exception as e:
-                logging.warning(f"Failed to copy {remote_path}: {str(e)}")
-                continue
+        manifest = [d for d in transfer_dirs if d in listing]
+        manifest += [f for f in listing if f in transfer_files or f.endswith('.yml')]
+        for missing in [path for path in transfer_dirs + transfer_files if path not in listing]:
+            logging.warning(f"Missing remote path: {remote_base}/{missing}")
+
+        # Pull everything in one rsync session
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as files_from:
+            files_from.write("\n".join(manifest) + "\n")
+            files_from.flush()
+            result = subprocess.run([
+                "rsync", "-azrP",
+                f"--files-from={files_from.name}",
+                "-e", SSH_COMMAND,
+                f"ubuntu@{public_url}:{remote_base}/",
+                f"{local_dir}/"
+            ])
+        if result.returncode != 0:
+            logging.warning(f"rsync exited with code {result.returncode}, some files may be missing")
 
+        # Keep a copy of the run config under the generic name
+        run_config = os.path.join(local_dir, f"config_{run_name}.yml")
+        if os.path.exists(run_config):
+            shutil.copy2(run_config, os.path.join(local_dir, "config.yml"))
 
         logging.info(f"Successfully copied all data to: {local_dir}")
         return local_dir
@@ -580,21 +830,46 @@ def copy_to_local(run_name, instance_no=0, overwrite=False):
         logging.error(f"Copy to local failed: {e}")
         return None
 
-def get_instance(instance_no=0):
+def _list_instances():
+    """Build the indexed instance list shown by get_instance"""
+    instances = []
+    for res in _cached_describe_instances():
+        for inst in res['Instances']:
+            instances.append({
+                'id': inst['InstanceId'],
+                'state': inst['State']['Name'],
+                'public_dns': inst.get('PublicDnsName', 'N/A'),
+                'type': inst['InstanceType'],
+                'launch_time': inst['LaunchTime'].strftime('%Y-%m-%d %H:%M:%S')
+            })
+    return instances
+
+def get_instance(instance_no=0, use_saved=True):
     try:
-        response = ec2.describe_instances()
-        instances = []
-        
-        # Build instance list
-        for res in response['Reservations']:
-            for inst in res['Instances']:
-                instances.append({
-                    'id': inst['InstanceId'],
-                    'state': inst['State']['Name'],
-                    'public_dns': inst.get('PublicDnsName', 'N/A'),
-                    'type': inst['InstanceType'],
-                    'launch_time': inst['LaunchTime'].strftime('%Y-%m-%d %H:%M:%S')
-                })
+        # Index 0 reuses this process's earlier lookup or the saved index-0 record;
+        # use_saved=False always lists (terminate/stop/restart/cancel_spot, get_instance)
+        pinned = None
+        if instance_no == 0 and use_saved:
+            if _current_instance and _current_instance['instance_id'] == os.getenv(INSTANCE_ID_VAR):
+                pinned = dict(_current_instance)
+            else:
+                pinned = _load_state()
+                if pinned and not _saved_instance_reachable(pinned):
+                    pinned = None
+
+        if pinned:
+            _use_instance(pinned['instance_id'], pinned['public_dns'], pinned['state'])
+            logging.info(f"🔍 Using instance {pinned['instance_id']} "
+                         f"({pinned['state'].upper()}, {pinned['public_dns']})")
+            return pinned['state']
+
+        instances = _list_instances()
+
+        # Every fresh listing rewrites the index-0 record so it matches what was printed
+        if instances and instances[0]['state'] == 'running':
+            _save_state(instances[0]['id'], instances[0]['public_dns'], instances[0]['state'])
+        else:
+            _clear_state()
 
         # Print table
         if instances:
@@ -614,8 +889,11 @@ def get_instance(instance_no=0):
             return None
             
         selected = instances[instance_no]
-        os.environ[INSTANCE_ID_VAR] = selected['id']
-        os.environ[PUBLIC_URL_VAR] = selected['public_dns']
+        if instance_no == 0:
+            _use_instance(selected['id'], selected['public_dns'], selected['state'])
+        else:
+            os.environ[INSTANCE_ID_VAR] = selected['id']
+            os.environ[PUBLIC_URL_VAR] = selected['public_dns']
         
         logging.info(f"🔍 Selected instance {instance_no}:")
         logging.info(f"   ID: {selected['id']}")
@@ -632,12 +910,78 @@ def get_instance(instance_no=0):
     
 
 
+def _index_list(value):
+    """argparse type for comma-separated instance indices, e.g. 0,2,5"""
+    try:
+        indices = [int(i) for i in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated instance numbers, got '{value}'")
+    if any(i < 0 for i in indices):
+        raise argparse.ArgumentTypeError(f"instance numbers must be 0 or greater, got '{value}'")
+    return list(dict.fromkeys(indices))
+
+def batch_action(action, instance_nos):
+    """Apply terminate/stop/restart/cancel_spot to several instances with one listing and one API call"""
+    try:
+        instances = _list_instances()
+        selected = []
+        for instance_no in instance_nos:
+            if not 0 <= instance_no < len(instances):
+                logging.error(f"❌ Invalid instance number: {instance_no}")
+                return
+            selected.append(instances[instance_no])
+        instance_ids = [inst['id'] for inst in selected]
+
+        logging.info(f"🔍 Batch {action} targets:")
+        for instance_no, inst in zip(instance_nos, selected):
+            logging.info(f"   {instance_no}: {inst['id']} ({inst['state'].upper()}, {inst['public_dns']})")
+
+        required_state = {'stop': 'running', 'restart': 'stopped'}.get(action)
+        if required_state:
+            wrong_state = [inst['id'] for inst in selected if inst['state'] != required_state]
+            if wrong_state:
+                logging.error(f"Instances not {required_state}: {', '.join(wrong_state)}")
+                return
+
+        if action == 'terminate':
+            ec2.terminate_instances(InstanceIds=instance_ids)
+        elif action == 'stop':
+            ec2.stop_instances(InstanceIds=instance_ids)
+        elif action == 'restart':
+            ec2.start_instances(InstanceIds=instance_ids)
+        elif action == 'cancel_spot':
+            spot_requests = ec2.describe_spot_instance_requests(
+                Filters=[{'Name': 'state', 'Values': ['active', 'open']}]
+            )['SpotInstanceRequests']
+            request_ids = [req['SpotInstanceRequestId'] for req in spot_requests
+                           if req.get('InstanceId') in instance_ids]
+            if not request_ids:
+                logging.error(f"No active spot requests found for instances {', '.join(instance_ids)}")
+                return
+            ec2.cancel_spot_instance_requests(SpotInstanceRequestIds=request_ids)
+            logging.info(f"Cancelled spot requests: {', '.join(request_ids)}")
+            return
+
+        _invalidate_describe_cache()
+        _clear_state()
+        if action in ('terminate', 'stop'):
+            for inst in selected:
+                close_ssh_master(inst['public_dns'])
+        logging.info(f"Batch {action} sent for instances: {', '.join(instance_ids)}")
+
+    except Exception as e:
+        logging.error(f"Batch {action} failed: {e}")
+
 def print_help():
     help_message = """
     Usage: imirunner.py <action> [options]
 
     Options:
         -i, --instance_no   0-based instance index (default: 0)
+        --no-cache          Always fetch fresh instance data from AWS, ignoring the
+                            instance saved in ~/.cache/imirunner (before <action>)
+        --dry-run           Log AWS calls and use canned responses instead (before <action>,
+                            or set IMIRUNNER_DRY_RUN=1)
 
     Actions:
         create [--options]       Start an EC2 instance. Pass additional options to the aws ec2 run-instances command
@@ -656,9 +1000,12 @@ def print_help():
         shell [-i NUM] [command] Open SSH session or execute command
         copy_local [-i NUM] <run_name> [--overwrite]
                                 Copy run results to local storage
-        copy_from_s3 [-i NUM] <run_name>
+        copy_from_s3 [-i NUM] <run_name[,run_name...]>
                                 Copy run output from S3 to instance
         get_instance [-i NUM]    Show details of running instances
+        batch <action> -i NUM,NUM,...
+                                Apply terminate/stop/restart/cancel_spot to several
+                                instances using a single instance listing
         help                    Print this help message
 
     Examples:
@@ -667,6 +1014,7 @@ def print_help():
         ./imirunner.py instance_setup 
         ./imirunner.py copy_local my_run -i 1
         ./imirunner.py shell "ls -l"
+        ./imirunner.py batch terminate -i 0,2,5
     """
     print(help_message)
 
@@ -687,6 +1035,10 @@ def instance_setup_cli(instance_no=0):
 def main():
     parser = argparse.ArgumentParser(description="Manage EC2 instances for methane inversion", 
                                    add_help=False)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not reuse cached instance listings')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Log AWS calls and return canned responses instead')
     subparsers = parser.add_subparsers(dest="command", title="subcommands",
                                      help='Available operations')
 
@@ -742,10 +1094,19 @@ def main():
 
     s3_parser = subparsers.add_parser('copy_from_s3', 
                                     help='Copy data from S3 to instance')
-    s3_parser.add_argument('run_name', help='Name of the run to copy')
+    s3_parser.add_argument('run_name', help='Name of the run to copy (comma-separate several runs)')
     s3_parser.add_argument('-i', '--instance', type=int, default=0,
                          help='Instance number (0-based index)')
 
+    # Batch instance management
+    batch_parser = subparsers.add_parser('batch',
+                                       help='Apply an action to several instances')
+    batch_parser.add_argument('action', choices=['terminate', 'stop', 'restart', 'cancel_spot'],
+                            help='Action to apply')
+    batch_parser.add_argument('-i', '--instances', required=True,
+                            type=_index_list,
+                            help='Comma-separated instance numbers (0-based indices)')
+
     # Diagnostic commands
     subparsers.add_parser('get_instance', 
                         help='List available instances').add_argument(
@@ -768,6 +1129,9 @@ def main():
 
     args = parser.parse_args()
 
+    if args.no_cache:
+        _describe_cache["ttl"] = 0
+
     # Command routing
     handlers = {
         'create': lambda: create_instance(args.options),
@@ -781,7 +1145,8 @@ def main():
         'log': lambda: tail_logfile(logfile=args.logfile, instance_no=args.instance),
         'copy_local': lambda: copy_to_local(args.run_name, args.instance, args.overwrite),
         'copy_from_s3': lambda: copy_from_s3(args.run_name, args.instance),
-        'get_instance': lambda: get_instance(args.instance),
+        'get_instance': lambda: get_instance(args.instance, use_saved=False),
+        'batch': lambda: batch_action(args.action, args.instances),
         'shell': lambda: open_shell(args.instance, args.shell_command),
         'help': lambda: print_help()
     }